@@ -4,22 +4,28 @@ Hypervolume indicator.
 """
 import json
 import logging
+import math
+import sys
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from itertools import chain, compress
+from operator import itemgetter
 from os import path
 from traceback import format_exc
 
 import click
 import numpy as np
-import yaml
-from jsonschema import validate
-from pygmo import (  # pylint: disable=no-name-in-module
-    hypervolume,
-    nadir,
-    pareto_dominance,
-)
+from fastjsonschema import JsonSchemaValueException as ValidationError
+from fastjsonschema import compile as compile_jsonschema
+from orjson import dumps, loads  # pylint: disable=no-name-in-module
 
 
 LOGGER = logging.getLogger(__name__)
 
+HV_CACHE_SIZE = 16
+HV_INCREMENTAL_MIN_OBJECTIVES = 4
+HV_2D_SWEEP_MIN_POINTS = 150
+
 
 REF_POINT_JSONSCHEMA = """{
   "$schema": "http://json-schema.org/draft-07/schema#",
@@ -50,28 +56,9 @@ SOLUTION_TO_SCORE_JSONSCHEMA = """{
   }
 }"""
 
-SOLUTIONS_SCORED_JSONSCHEMA = """{
-  "$schema": "http://json-schema.org/draft-07/schema#",
-  "title": "Solutions scored",
-  "type": "array",
-  "items": {
-    "type": "object",
-    "properties": {
-      "objective": {
-        "OneOf": [
-          {"type": "null"},
-          {"type": "array", "minItems": 1, "items": {"type": "number"}}
-        ]
-      },
-      "constraint": {
-        "OneOf": [
-          {"type": ["number", "null"]},
-          {"type": "array", "minItems": 1, "items": {"type": "number"}}
-        ]
-      }
-    }
-  }
-}"""
+# Schemas are compiled into Python functions once to skip keyword dispatch per call
+validate_ref_point = compile_jsonschema(json.loads(REF_POINT_JSONSCHEMA))
+validate_solution_to_score = compile_jsonschema(json.loads(SOLUTION_TO_SCORE_JSONSCHEMA))
 
 
 def load_config(ctx, _, value):
@@ -83,8 +70,13 @@ def load_config(ctx, _, value):
     """
     if not path.exists(value):
         return {}
+    import yaml  # pylint: disable=import-outside-toplevel
+
     with open(value, encoding="utf-8") as file:
-        ctx.default_map = yaml.safe_load(file)
+        # libyaml's loader is used if PyYAML is built with it
+        ctx.default_map = yaml.load(
+            file, Loader=getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+        )
         if not isinstance(ctx.default_map, dict):
             raise TypeError(
                 f"The content of `{value}` must be dict, but {type(ctx.default_map)}."
@@ -114,34 +106,307 @@ def feasible(solution):
     :param solution: A solution
     :return: boolean
     """
-    objective = solution.get("objective")
     constraint = solution.get("constraint")
-    return (None not in np.array(objective)) and (
-        constraint is None or np.all(np.array(constraint) <= 0.0)
+    validate_constraints([constraint])
+    objective = solution.get("objective")
+    if objective is None or None in objective:
+        return False
+    if constraint is None:
+        return True
+    if isinstance(constraint, list):  # a few elements, not worth an array
+        return all(c <= 0.0 for c in constraint)
+    return constraint <= 0.0
+
+
+def validate_constraints(constraints):
+    """Check that no constraint vector contains null, of which feasibility is undefined.
+    :param constraints: A list of constraint values or vectors
+    """
+    if any(None in c for c in constraints if isinstance(c, list)):
+        raise ValidationError("Constraint vectors must not contain null.")
+
+
+def feasibility_mask(solutions):
+    """Check if each of given solutions is feasible or not at once.
+    :param solutions: A list of solutions
+    :return: A (n_solutions, ) boolean array
+    """
+    objectives = [s.get("objective") for s in solutions]
+    constraints = [s.get("constraint") for s in solutions]
+    mask = np.array([o is not None and None not in o for o in objectives], dtype=bool)
+    widths = np.array(
+        [0 if c is None else len(c) if isinstance(c, list) else 1 for c in constraints],
+        dtype=np.intp,
     )
+    if not widths.any():
+        return mask
+    # Checked before the float conversion, which would make null NaN
+    validate_constraints(constraints)
+    # Pad constraints into a matrix with -inf, which never violates a constraint
+    values = np.fromiter(
+        chain.from_iterable(
+            c if isinstance(c, list) else (c,) for c in constraints if c is not None
+        ),
+        dtype=np.float64,
+        count=int(widths.sum()),
+    )
+    rows = np.repeat(np.arange(len(solutions)), widths)
+    cols = np.arange(len(values)) - np.repeat(np.cumsum(widths) - widths, widths)
+    constraint_matrix = np.full((len(solutions), widths.max()), -np.inf)
+    constraint_matrix[rows, cols] = values
+    return mask & np.all(constraint_matrix <= 0.0, axis=1)
+
+
+@lru_cache(maxsize=None)
+def pareto_mask_kernel():
+    """Load moocore's divide-and-conquer kernel finding the pareto-efficient points on first use.
+    :return: The kernel, or None if moocore is not installed
+    """
+    try:
+        from moocore import (  # pylint: disable=import-outside-toplevel
+            is_nondominated,
+        )
+    except ImportError:  # moocore is optional
+        return None
+    return is_nondominated
+
+
+@lru_cache(maxsize=None)
+def nondominated_filter_kernel():
+    """Compile a kernel finding the points contributing to hypervolume with Numba on first use.
+    :return: The compiled kernel, or None if Numba is not installed
+    """
+    try:
+        from numba import njit  # pylint: disable=import-outside-toplevel
+    except ImportError:  # Numba is optional
+        return None
+
+    @njit(cache=True)
+    def filter_nondominated(points, ref_point, order):
+        """Find the unique nondominated points dominating the reference point in one pass.
+        Points are visited in lexicographic order, so that a point can only be weakly
+        dominated by a point already kept. Numba does not check bounds, so the reference
+        point must be validated to have as many elements as the points by the caller.
+        """
+        n_points, n_costs = points.shape
+        is_kept = np.zeros(n_points, dtype=np.bool_)
+        kept = np.empty(n_points, dtype=np.intp)
+        n_kept = 0
+        for i in order:
+            dominating = False
+            for k in range(n_costs):
+                if points[i, k] > ref_point[k]:
+                    dominating = False
+                    break
+                if points[i, k] < ref_point[k]:
+                    dominating = True
+            if not dominating:
+                continue
+            for j in kept[:n_kept]:
+                dominated = True
+                for k in range(n_costs):
+                    if points[j, k] > points[i, k]:
+                        dominated = False
+                        break
+                if dominated:
+                    break
+            else:
+                kept[n_kept] = i
+                n_kept += 1
+                is_kept[i] = True
+        return is_kept
+
+    return filter_nondominated
 
 
 def is_pareto_efficient(costs):
     """
-    Find the pareto-efficient points
+    Find the pareto-efficient points, of which duplicates are counted only once
     :param costs: An (n_points, n_costs) array
     :return: A (n_points, ) boolean array, indicating whether each point is Pareto efficient
     """
-    is_efficient = np.ones(costs.shape[0], dtype=bool)
-    for i, cost in enumerate(costs):
-        if is_efficient[i]:
-            is_efficient[is_efficient] = np.any(
-                costs[is_efficient] < cost, axis=1
-            )  # Keep any point with a lower cost
-            is_efficient[i] = True  # And keep self
+    is_efficient = np.zeros(costs.shape[0], dtype=bool)
+    if costs.shape[0] == 0:
+        return is_efficient
+
+    kernel = pareto_mask_kernel() if costs.shape[1] >= 4 else None
+    if kernel is not None:
+        return kernel(np.ascontiguousarray(costs, dtype=np.float64))
+
+    # Sort points lexicographically so that a point can only be dominated by its predecessors
+    order = np.lexsort(costs.T[::-1])
+    sorted_costs = costs[order]
+
+    if costs.shape[1] == 2:
+        # A point is dominated iff its second cost is not below the running minimum
+        # of its predecessors' second costs
+        min_so_far = np.minimum.accumulate(sorted_costs[:, 1])
+        is_efficient[order[0]] = True
+        is_efficient[order[1:]] = sorted_costs[1:, 1] < min_so_far[:-1]
+        return is_efficient
+
+    if costs.shape[1] == 3:
+        # A point is dominated iff the 2D staircase of its predecessors' last two costs
+        # covers it
+        front_y, front_z = [], []  # y ascending, z descending
+        for i, (_, y, z) in zip(order.tolist(), sorted_costs.tolist()):
+            if insert_into_staircase(front_y, front_z, y, z) is not None:
+                is_efficient[i] = True
+        return is_efficient
+
+    # The running minimum is not exact for d >= 3, so sweep the sorted points instead:
+    # the first remaining point is efficient and discards every point it weakly dominates.
+    remaining = np.arange(costs.shape[0])
+    while remaining.size > 0:
+        is_efficient[order[remaining[0]]] = True
+        remaining = remaining[1:][
+            np.any(sorted_costs[remaining[1:]] < sorted_costs[remaining[0]], axis=1)
+        ]
     return is_efficient
 
 
-def compute_hv(solution_to_score, solutions_scored, ref_point):
-    """Compute hypervolume."""
+def insert_into_staircase(front_x, front_y, x, y):
+    """Insert a point into a 2-dimensional staircase unless the staircase covers it.
+    A point covered by the staircase is weakly dominated by one of its points.
+    :param front_x: A list of the first costs of the staircase in ascending order
+    :param front_y: A list of the second costs of the staircase in descending order
+    :param x: The first cost of the point
+    :param y: The second cost of the point
+    :return: The index of the inserted point and the lists of the first and second costs
+        of the points it replaced, or None if the staircase covers the point
+    """
+    i = bisect_right(front_x, x)
+    if i > 0 and front_y[i - 1] <= y:
+        return None
+    i = bisect_left(front_x, x)
+    j = i  # front[i:j] is dominated by (x, y)
+    while j < len(front_x) and front_y[j] >= y:
+        j += 1
+    removed = front_x[i:j], front_y[i:j]
+    front_x[i:j] = [x]
+    front_y[i:j] = [y]
+    return i, removed
+
+
+def compute_hv_2d(points, ref_point):
+    """Compute 2-dimensional hypervolume by a sweep in O(n log n) time.
+    :param points: An (n_points, 2) array of points dominating the reference point
+    :param ref_point: A reference point
+    :return: Hypervolume
+    """
+    points = points[np.argsort(points[:, 0])]
+    widths = np.diff(points[:, 0], append=ref_point[0])
+    heights = ref_point[1] - np.minimum.accumulate(points[:, 1])
+    return float(np.sum(widths * heights))
+
+
+def compute_hv_3d(points, ref_point):  # pylint: disable=too-many-locals
+    """Compute 3-dimensional hypervolume by a sweep.
+    Slices are swept along the third objective while the 2-dimensional front
+    of the swept points is kept as a staircase sorted by the first objective.
+    :param points: An (n_points, 3) array of points dominating the reference point
+    :param ref_point: A reference point
+    :return: Hypervolume
+    """
+    points = points[np.argsort(points[:, 2])]
+    ref_x, ref_y = float(ref_point[0]), float(ref_point[1])
+    front_x, front_y = [], []  # x ascending, y descending
+    area, volume = 0.0, 0.0
+    for (x, y), depth in zip(
+        points[:, :2].tolist(), np.diff(points[:, 2], append=ref_point[2]).tolist()
+    ):
+        inserted = insert_into_staircase(front_x, front_y, x, y)
+        if inserted is not None:
+            i, (removed_x, removed_y) = inserted
+            bounds = removed_x + [front_x[i + 1] if i + 1 < len(front_x) else ref_x]
+            area += (bounds[0] - x) * ((front_y[i - 1] if i > 0 else ref_y) - y)
+            area += sum(
+                (right - left) * (top - y)
+                for left, right, top in zip(bounds, bounds[1:], removed_y)
+            )
+        volume += area * depth
+    return volume
+
+
+def compute_hv_of_points(points, ref_point):
+    """Compute hypervolume of points dominating the reference point.
+    :param points: An (n_points, n_objectives) array
+    :param ref_point: A reference point
+    :return: Hypervolume
+    """
+    if len(points) == 0:
+        return 0.0
+    # A single point spans a box, no algorithm is needed
+    if len(points) == 1:
+        LOGGER.info("Compute HV of a single point...")
+        score = float(np.prod(np.asarray(ref_point, dtype=np.float64) - points[0]))
+    # The sweeps save importing PyGMO in a one-shot run. Once it is loaded, its 2D and
+    # 3D algorithms are faster except for large 2D sets.
+    elif points.shape[1] == 2 and (
+        "pygmo" not in sys.modules or len(points) >= HV_2D_SWEEP_MIN_POINTS
+    ):
+        LOGGER.info("Compute HV by 2D sweep...")
+        score = compute_hv_2d(points, ref_point)
+    elif points.shape[1] == 3 and "pygmo" not in sys.modules:
+        LOGGER.info("Compute HV by 3D sweep...")
+        score = compute_hv_3d(points, ref_point)
+    else:
+        # PyGMO takes a while to load, so it is imported only when needed
+        from pygmo import (  # pylint: disable=import-outside-toplevel,no-name-in-module
+            hypervolume,
+        )
+
+        LOGGER.info("Initialize a HV calculator...")
+        hvi = hypervolume(np.ascontiguousarray(points, dtype=np.float64))
+        hvi.copy_points = False  # WFG may work on the points in place as they are used once
+        LOGGER.info("...Initialized")
+
+        LOGGER.info("Compute HV...")
+        score = hvi.compute(ref_point)
+    LOGGER.debug("score = %s", score)
+    LOGGER.info("...Computed")
+    return score
+
+
+def objective_array(objectives):
+    """Convert objective vectors into a float array.
+    :param objectives: A list of objective vectors
+    :return: An (n_points, n_objectives) float array
+    """
+    try:
+        lengths = set(map(len, objectives))
+    except TypeError as e:
+        raise ValidationError(f"Invalid objectives: {e}") from e
+    if len(lengths) != 1:
+        raise ValidationError(
+            f"Objectives must be vectors of the same length, but {sorted(lengths)}."
+        )
+    (n_objectives,) = lengths
+    # Fill a preallocated buffer in one pass without nested lists
+    try:
+        array = np.fromiter(
+            chain.from_iterable(objectives),
+            dtype=np.float64,
+            count=len(objectives) * n_objectives,
+        )
+    except (TypeError, ValueError) as e:
+        raise ValidationError(f"Invalid objectives: {e}") from e
+    return array.reshape(len(objectives), n_objectives)
+
+
+def compute_hv(solution_to_score, solutions_scored, ref_point, cache=None):
+    """Compute hypervolume.
+    :param cache: A dict to reuse hypervolume of solutions scored across calls
+    """
     LOGGER.info("Filter feasible solutions...")
-    feasible_objectives = [s["objective"] for s in solutions_scored if feasible(s)]
-    if feasible(solution_to_score):
+    feasible_objectives = list(
+        map(
+            itemgetter("objective"),
+            compress(solutions_scored, feasibility_mask(solutions_scored)),
+        )
+    )
+    is_feasible = feasible(solution_to_score)
+    if is_feasible:
         feasible_objectives.append(solution_to_score["objective"])
     else:
         LOGGER.warning("Current solution is not feasible.")
@@ -157,70 +422,263 @@ def compute_hv(solution_to_score, solutions_scored, ref_point):
     if not feasible_objectives:  # no feasible point
         LOGGER.warning("No feasible point. HV is zero.")
         return 0
+    objectives = objective_array(feasible_objectives)
+    front = objectives
 
     if not ref_point:
         LOGGER.warning("HV_REF_POINT is not specified. Try to use the nadir point.")
-        if (
-            len(feasible_objectives) == 1
-        ):  # HV=0 since nadir() requires at least two feasible points
-            LOGGER.warning(
-                "The nadir point requires at least two feasible points. HV is zero."
-            )
-            return 0
-        ref_point = nadir(feasible_objectives)
+        # The worst objective values over the nondominated front. For a single point,
+        # the nadir point is the point itself and HV is zero.
+        front = objectives[is_pareto_efficient(objectives)]
+        ref_point = front.max(axis=0)
         LOGGER.warning("The nadir point is set to %s.", ref_point)
     LOGGER.debug("ref_point = %s", ref_point)
 
     LOGGER.info("Validate the reference point...")
-    validate(ref_point, json.loads(REF_POINT_JSONSCHEMA))
+    validate_ref_point(ref_point)
     LOGGER.info("...Validated")
     LOGGER.info("Reference point is %s", ref_point)
+    ref_point = np.asarray(ref_point, dtype=np.float64)
+    # Checked here as the masks and kernels below would broadcast or overrun a mismatch
+    if ref_point.shape != objectives.shape[1:]:
+        raise ValidationError(
+            f"The reference point must be a vector of length {objectives.shape[1]}, "
+            f"but {ref_point.tolist()}."
+        )
+
+    # The clipped set is as large as the archive, so the update only beats computing
+    # HV from scratch where HV takes superlinear time in the number of points
+    if cache is not None and objectives.shape[1] >= HV_INCREMENTAL_MIN_OBJECTIVES:
+        return compute_hv_incrementally(
+            objectives[:-1] if is_feasible else objectives,
+            objectives[-1] if is_feasible else None,
+            ref_point,
+            cache,
+        )
+
+    # The front found for the nadir point only needs the reference point filter
+    efficient_objectives = nondominated_points(
+        front, ref_point, filtered=front is not objectives
+    )
+    if len(efficient_objectives) == 0:
+        LOGGER.warning("No point dominates the reference point. HV is zero.")
+        return 0
+
+    return compute_hv_of_points(efficient_objectives, ref_point)
 
+
+def nondominated_points(objectives, ref_point, filtered=False):
+    """Find the points contributing to hypervolume.
+    :param objectives: An (n_points, n_objectives) array
+    :param ref_point: A reference point array
+    :param filtered: Whether dominated and duplicate points are already removed
+    :return: An array of the points dominating the reference point, from which
+        dominated and duplicate points are also removed for 4 or more objectives
+    """
     # PyGMO's HV algorithm (WFG-algorithm) has time complexity between
     # Omega(n^{d/2} log n) and O(n^{d-1}) for n points of d dimensions.
     # To accelerate HV computation, points with no HV contribution are excluded.
 
+    # Steps 1-2 are fused into one compiled pass unless moocore is there for step 2.
+    # Importing Numba takes longer than the filter in a one-shot run, so the pass is
+    # only taken once Numba is loaded as in serve().
+    kernel = (
+        nondominated_filter_kernel()
+        if objectives.shape[1] >= 4
+        and not filtered
+        and "numba" in sys.modules
+        and pareto_mask_kernel() is None
+        else None
+    )
+    if kernel is not None:
+        LOGGER.info("Filter nondominated points dominating the reference point...")
+        efficient_objectives = objectives[
+            kernel(
+                np.ascontiguousarray(objectives),
+                ref_point,
+                np.lexsort(objectives.T[::-1]),
+            )
+        ]
+        LOGGER.debug("efficient_objectives = %s", efficient_objectives)
+        LOGGER.info("...Filtered")
+        return efficient_objectives
+
     # 1. Remove points that do not dominates the reference point in O(dn) time
     LOGGER.info("Filter points not dominating the reference point...")
-    hv_objectives = np.array(
-        [y for y in feasible_objectives if pareto_dominance(y, ref_point)]
+    dominating = np.all(objectives <= ref_point, axis=1) & np.any(
+        objectives < ref_point, axis=1
     )
+    hv_objectives = objectives[dominating]
     LOGGER.debug("hv_objectives = %s", hv_objectives)
     LOGGER.info("...Filtered")
-
-    # 2. Remove duplicate points in O(dn) time
-    LOGGER.info("Uniquify points...")
-    unique_hv_objectives = np.unique(hv_objectives, axis=0)
-    LOGGER.debug("unique_hv_objectives = %s", unique_hv_objectives)
-    LOGGER.info("...Uniquified")
-
-    # 3. Remove dominated points in O(dn^2) time
+    if not dominating.any():  # nothing to filter
+        return hv_objectives
+
+    # 2. Remove dominated and duplicate points in O(dn^2) time
+    # The 2D and 3D sweeps skip dominated points by themselves, for which the filter
+    # would cost more than it saves.
+    if hv_objectives.shape[1] <= 3 or filtered:
+        return hv_objectives
     LOGGER.info("Compute nondominated front...")
-    efficient_objectives = unique_hv_objectives[
-        is_pareto_efficient(unique_hv_objectives)
-    ]
+    efficient_objectives = hv_objectives[is_pareto_efficient(hv_objectives)]
     LOGGER.debug("efficient_objectives = %s", efficient_objectives)
     LOGGER.info("...Computed")
+    return efficient_objectives
+
+
+def compute_hv_incrementally(archive, point, ref_point, cache):
+    """Compute hypervolume of an archive and a point, reusing a cached hypervolume of the archive.
+    S(A + {p}) = S(A) + S({p}) - S(A clipped by p) for a cached S(A),
+    and S(A + {p}) is computed directly otherwise.
+    :param archive: An (n_points, n_objectives) array of the archive
+    :param point: A point to add, or None if no point is added
+    :param ref_point: A reference point array
+    :param cache: A dict mapping a front and a reference point to its hypervolume
+    :return: Hypervolume
+    """
+    front = nondominated_points(archive, ref_point)
+    score = cache.get(hv_cache_key(front, ref_point))
+    LOGGER.info("Hypervolume of the archive is cached: %s", score)
+
+    if point is not None and np.all(point <= ref_point) and np.any(point < ref_point):
+        if score is not None:
+            LOGGER.info("Compute the exclusive contribution of the current solution...")
+            clipped = nondominated_points(np.maximum(front, point), ref_point)
+            score += float(np.prod(ref_point - point)) - compute_hv_of_points(
+                clipped, ref_point
+            )
+            LOGGER.info("...Computed")
+        # Update the front in O(dn) time instead of filtering it again, for which it
+        # has to be free of dominated points as with 4 or more objectives
+        if not np.any(np.all(front <= point, axis=1)):
+            front = np.vstack([front[np.any(front < point, axis=1)], point])
+
+    if score is None:
+        score = compute_hv_of_points(front, ref_point)
+
+    if len(cache) >= HV_CACHE_SIZE:
+        del cache[next(iter(cache))]  # evict the oldest entry
+    cache[hv_cache_key(front, ref_point)] = score
+    return score
 
-    if len(efficient_objectives) == 0:
-        LOGGER.warning("No point dominates the reference point. HV is zero.")
-        return 0
 
-    LOGGER.info("Initialize a HV calculator...")
-    hvi = hypervolume(efficient_objectives)
-    LOGGER.info("...Initialized")
+def hv_cache_key(front, ref_point):
+    """Make a key of the hypervolume cache, which does not depend on the order of points.
+    :param front: An (n_points, n_objectives) array
+    :param ref_point: A reference point array
+    :return: A hashable key
+    """
+    return front[np.lexsort(front.T[::-1])].tobytes(), ref_point.tobytes()
+
+
+def read_line():
+    """Read a line from stdin as raw bytes, skipping text decoding.
+    :return bytes: A line without the trailing newline
+    """
+    line = sys.stdin.buffer.readline()
+    if not line:
+        raise EOFError("EOF when reading a line")
+    return line.rstrip(b"\r\n")
+
+
+def write_result(result):
+    """Write a result to stdout as a line of JSON.
+    :param result: A result to write
+    """
+    sys.stdout.buffer.write(dumps(result) + b"\n")
+    sys.stdout.buffer.flush()
 
-    LOGGER.info("Compute HV...")
-    score = hvi.compute(ref_point)
-    LOGGER.debug("score = %s", score)
-    LOGGER.info("...Computed")
-    return score
+
+def write_score(score):
+    """Write a score to stdout as a line of JSON, formatting it without a JSON encoder.
+    :param score: A score
+    """
+    score = float(score)
+    if not math.isfinite(score):  # no JSON literal; the encoder writes null
+        write_result({"score": score})
+        return
+    sys.stdout.buffer.write(b'{"score":' + repr(score).encode() + b"}\n")
+    sys.stdout.buffer.flush()
+
+
+def score_solution(
+    json_solution_to_score, json_solutions_scored, ref_point, cache=None
+):
+    """Parse and validate input lines, and then compute hypervolume.
+    :param json_solution_to_score: JSON of a solution to score
+    :param json_solutions_scored: JSON of solutions scored
+    :param ref_point: Reference point
+    :param cache: A dict to reuse hypervolume of solutions scored across calls
+    :return: Hypervolume
+    """
+    LOGGER.info("Parse a solution to score...")
+    solution_to_score = loads(json_solution_to_score)
+    LOGGER.debug("solution_to_score = %s", solution_to_score)
+    LOGGER.info("...Parsed")
+
+    LOGGER.info("Validate a solution to score...")
+    validate_solution_to_score(solution_to_score)
+    LOGGER.info("...Validated")
+
+    LOGGER.info("Parse solutions scored...")
+    solutions_scored = loads(json_solutions_scored)
+    LOGGER.debug("solutions_scored = %s", solutions_scored)
+    LOGGER.info("...Parsed")
+
+    LOGGER.info("Validate solutions scored...")
+    # Objectives are validated by the float conversion in compute_hv()
+    if not isinstance(solutions_scored, list) or not all(
+        isinstance(s, dict) for s in solutions_scored
+    ):
+        raise ValidationError("Solutions scored must be an array of objects.")
+    LOGGER.info("...Validated")
+
+    return compute_hv(solution_to_score, solutions_scored, ref_point, cache)
+
+
+def serve(ref_point):
+    """Score pairs of input lines until EOF, writing a result line for each pair.
+    For 4 or more objectives, hypervolume of solutions scored is cached so that
+    a request that extends the previous one only computes the contribution of the new
+    solution.
+    :param ref_point: Reference point
+    """
+    # Loading PyGMO once lets every request use its faster HV algorithms
+    import pygmo  # pylint: disable=import-outside-toplevel,unused-import
+
+    # So does the compiled filter, for which Numba is loaded unless moocore filters
+    if pareto_mask_kernel() is None:
+        nondominated_filter_kernel()
+
+    cache = {}
+    while True:
+        LOGGER.info("Wait for a request...")
+        try:
+            json_solution_to_score = read_line()
+        except EOFError:
+            LOGGER.info("...EOF")
+            return
+        try:
+            json_solutions_scored = read_line()
+            score = score_solution(
+                json_solution_to_score, json_solutions_scored, ref_point, cache
+            )
+            write_score(score)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            LOGGER.error(format_exc())
+            write_result({"score": None, "error": str(e)})
 
 
 @click.command(help="Hypervolume indicator.")
 @click.option(
     "-r", "--ref-point", callback=json_list, default=None, help="Reference points."
 )
+@click.option(
+    "-s",
+    "--server",
+    is_flag=True,
+    help="Keep scoring pairs of input lines until EOF.",
+)
 @click.option("-q", "--quiet", count=True, help="Be quieter.")
 @click.option("-v", "--verbose", count=True, help="Be more verbose.")
 @click.option(
@@ -234,52 +692,44 @@ def compute_hv(solution_to_score, solutions_scored, ref_point):
 )
 @click.version_option("1.0.0")
 @click.pass_context
-def main(ctx, ref_point, quiet, verbose, config):  # pylint: disable=unused-argument
+def main(  # pylint: disable=unused-argument,too-many-arguments
+    ctx, *, ref_point, server, quiet, verbose, config
+):
     """Calculate hypervolume indicator."""
     verbosity = 10 * (quiet - verbose)
     log_level = logging.WARNING + verbosity
-    logging.basicConfig(level=log_level)
+    # An embedding application keeps its own handlers, only the level is applied
+    if logging.getLogger().handlers:
+        LOGGER.setLevel(log_level)
+    else:
+        logging.basicConfig(level=log_level)
     LOGGER.info("Log level is set to %d.", log_level)
 
+    if server:
+        serve(ref_point)
+        return
+
     LOGGER.info("Recieve a solution to score...")
-    json_solution_to_score = input()
+    json_solution_to_score = read_line()
     LOGGER.debug("json_solution_to_score = %s", json_solution_to_score)
     LOGGER.info("...Recieved")
 
     LOGGER.info("Recieve solutions scored...")
-    json_solutions_scored = input()
+    json_solutions_scored = read_line()
     LOGGER.debug("json_solutions_scored = %s", json_solutions_scored)
     LOGGER.info("...Recieved")
 
-    LOGGER.info("Parse a solution to score...")
-    solution_to_score = json.loads(json_solution_to_score)
-    LOGGER.debug("solution_to_score = %s", solution_to_score)
-    LOGGER.info("...Parsed")
-
-    LOGGER.info("Validate a solution to score...")
-    validate(solution_to_score, json.loads(SOLUTION_TO_SCORE_JSONSCHEMA))
-    LOGGER.info("...Validated")
-
-    LOGGER.info("Parse solutions scored...")
-    solutions_scored = json.loads(json_solutions_scored)
-    LOGGER.debug("solutions_scored = %s", solutions_scored)
-    LOGGER.info("...Parsed")
-
-    LOGGER.info("Validate solutions scored...")
-    validate(solutions_scored, json.loads(SOLUTIONS_SCORED_JSONSCHEMA))
-    LOGGER.info("...Validated")
-
-    score = compute_hv(solution_to_score, solutions_scored, ref_point)
-    print(json.dumps({"score": score}))
+    score = score_solution(json_solution_to_score, json_solutions_scored, ref_point)
+    write_score(score)
 
 
 if __name__ == "__main__":
     try:
         LOGGER.info("Start")
-        main(  # pylint: disable=no-value-for-parameter,unexpected-keyword-arg
+        main(  # pylint: disable=no-value-for-parameter,unexpected-keyword-arg,missing-kwoa
             auto_envvar_prefix="HV"
         )
         LOGGER.info("Successfully finished")
     except Exception as e:  # pylint: disable=broad-exception-caught
         LOGGER.error(format_exc())
-        print(json.dumps({"score": None, "error": str(e)}))
+        write_result({"score": None, "error": str(e)})